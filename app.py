@@ -5,10 +5,17 @@ import numpy as np
 import folium
 from streamlit_folium import st_folium
 import joblib
-from netCDF4 import Dataset
-import cdsapi
 from datetime import date
 
+from era5_io import (
+    ERA5_VARS,
+    init_cds_client,
+    download_era5,
+    download_era5_batch,
+    extract_nearest_values_batch,
+    fetch_era5_zarr,
+)
+
 # ---------------------------
 # Page configuration
 # ---------------------------
@@ -26,28 +33,38 @@ st.markdown(
 # ---------------------------
 # Set up CDS API credentials (Streamlit Cloud)
 # ---------------------------
-cds_path = os.path.expanduser("~/.cdsapirc")
-if not os.path.exists(cds_path):
-    try:
-        with open(cds_path, "w") as f:
-            f.write(
-                f"url: https://cds.climate.copernicus.eu/api\n"
-                f"key: {st.secrets['CDSAPI_UID']}:{st.secrets['CDSAPI_KEY']}\n"
-            )
-    except KeyError:
-        st.error("⚠️ CDS API credentials not set in Streamlit secrets!")
-
-client = cdsapi.Client()
+init_cds_client()
 
 # ---------------------------
 # Load trained model + scaler
 # ---------------------------
 MODEL_PATH = "rf_pipeline.pkl"  # make sure the .pkl file is in repo root
+ONNX_PATH = "rf_pipeline.onnx"  # optional, produced by export_onnx.py
 model, scaler_target = None, None
 
+@st.cache_resource(show_spinner=False)
+def load_model(model_path):
+    # Cached so the pickle is deserialized once per session, not per rerun
+    return joblib.load(model_path)
+
+@st.cache_resource(show_spinner=False)
+def load_onnx_session(onnx_path):
+    import onnxruntime as ort
+    return ort.InferenceSession(onnx_path, providers=["CPUExecutionProvider"])
+
+def predict_co2(X):
+    # Prefer the ONNX session: compiled tree traversal instead of
+    # sklearn's Python-level walker. Falls back to the pickle if no
+    # exported model is present.
+    if os.path.exists(ONNX_PATH):
+        sess = load_onnx_session(ONNX_PATH)
+        X32 = np.asarray(X, dtype=np.float32)
+        return sess.run(None, {sess.get_inputs()[0].name: X32})[0].ravel()
+    return model.predict(X)
+
 if os.path.exists(MODEL_PATH):
     try:
-        bundle = joblib.load(MODEL_PATH)
+        bundle = load_model(MODEL_PATH)
         model = bundle.get("model", None)
         scaler_target = bundle.get("scaler_target", None)
         if model and scaler_target:
@@ -60,57 +77,9 @@ else:
     st.error("⚠️ Model file not found. Please check path!")
 
 # ---------------------------
-# Variable mappings
+# Model feature order
 # ---------------------------
-VAR_MAP = {
-    "10m_u_component_of_wind": "u10",
-    "10m_v_component_of_wind": "v10",
-    "2m_temperature": "t2m",
-    "surface_pressure": "sp",
-    "high_vegetation_cover": "cvh",
-    "low_vegetation_cover": "cvl",
-    "leaf_area_index_high_vegetation": "lai_hv",
-    "leaf_area_index_low_vegetation": "lai_lv",
-}
-
-# ---------------------------
-# ERA5 download function
-# ---------------------------
-def download_era5(year, month, day, save_path, variables, prefix):
-    nc_filename = f"{prefix}_{year}-{month:02d}-{day:02d}.nc"
-    nc_path = os.path.join(save_path, nc_filename)
-    if not os.path.exists(nc_path):
-        client.retrieve(
-            "reanalysis-era5-single-levels",
-            {
-                "product_type": ["reanalysis"],
-                "variable": variables,
-                "year": str(year),
-                "month": f"{month:02d}",
-                "day": f"{day:02d}",
-                "time": ["13:00"],
-                "format": "netcdf"
-            }
-        ).download(nc_path)
-    return nc_path
-
-# ---------------------------
-# Extract nearest values
-# ---------------------------
-def extract_nearest_values(nc_path, lat, lon, requested_vars):
-    values = {}
-    with Dataset(nc_path, mode="r") as nc_file:
-        lon_values = nc_file.variables["longitude"][:]
-        lat_values = nc_file.variables["latitude"][:]
-        lon_idx = np.abs(lon_values - lon).argmin()
-        lat_idx = np.abs(lat_values - lat).argmin()
-        for req_var in requested_vars:
-            nc_var = VAR_MAP.get(req_var, req_var)
-            if nc_var in nc_file.variables:
-                values[nc_var] = float(nc_file.variables[nc_var][0, lat_idx, lon_idx])
-            else:
-                values[nc_var] = None
-    return values
+PREDICTORS = ['latitude','longitude','year','month','day','sp','t2m','u10','v10','lai_hv','lai_lv','cvh','cvl']
 
 # ---------------------------
 # UI: Date and Map Selection
@@ -127,16 +96,26 @@ with col1:
         max_value=date.today()
     )
 
+@st.cache_resource(show_spinner=False)
+def base_map():
+    # The tile-layer HTML/JS blob is identical every rerun; build it once.
+    # The marker goes in a separate feature group so the cached map
+    # object itself is never mutated.
+    return folium.Map(location=[20,0], zoom_start=2, prefer_canvas=True)
+
 with col2:
     st.subheader("📍 Select Location")
-    m = folium.Map(location=[20,0], zoom_start=2)
+    m = base_map()
+    fg = folium.FeatureGroup(name="selection")
     if "last_clicked" in st.session_state:
-        folium.Marker(
+        fg.add_child(folium.Marker(
             list(st.session_state["last_clicked"]),
             tooltip="Selected Location",
             icon=folium.Icon(color="red", icon="map-marker")
-        ).add_to(m)
-    map_data = st_folium(m, width=700, height=450)
+        ))
+    map_data = st_folium(m, width=700, height=450,
+                         feature_group_to_add=fg,
+                         returned_objects=["last_clicked"])
     if map_data and map_data["last_clicked"]:
         st.session_state["last_clicked"] = (
             map_data["last_clicked"]["lat"],
@@ -144,44 +123,88 @@ with col2:
         )
 
 # ---------------------------
-# Prediction logic
+# Prediction logic (batched)
 # ---------------------------
+# Queries accumulate in session state and are predicted in one
+# model.predict call: the RandomForest pays its per-call dispatch
+# overhead once instead of once per point.
+if "pending_queries" not in st.session_state:
+    st.session_state["pending_queries"] = []
+
 if selected_date and "last_clicked" in st.session_state:
-    save_dir = "era5_data"
-    os.makedirs(save_dir, exist_ok=True)
     lat, lon = st.session_state["last_clicked"]
-
-    try:
-        # --- Download ERA5 data ---
-        meteo_vars = ["10m_u_component_of_wind","10m_v_component_of_wind","2m_temperature","surface_pressure"]
-        veg_vars = ["high_vegetation_cover","leaf_area_index_high_vegetation","leaf_area_index_low_vegetation","low_vegetation_cover"]
-        nc_meteo = download_era5(selected_date.year, selected_date.month, selected_date.day, save_dir, meteo_vars, "meteo")
-        nc_veg = download_era5(selected_date.year, selected_date.month, selected_date.day, save_dir, veg_vars, "veg")
-
-        # --- Extract values ---
-        values_meteo = extract_nearest_values(nc_meteo, lat, lon, meteo_vars)
-        values_veg = extract_nearest_values(nc_veg, lat, lon, veg_vars)
-        all_values = {**values_meteo, **values_veg}
-
-        # --- Prepare DataFrame ---
-        df = pd.DataFrame([{"date": selected_date, "latitude": lat, "longitude": lon, **all_values}])
-        df["year"], df["month"], df["day"] = selected_date.year, selected_date.month, selected_date.day
-
-        # --- Predict CO2 ---
-        if model and scaler_target:
-            predictors = ['latitude','longitude','year','month','day','sp','t2m','u10','v10','lai_hv','lai_lv','cvh','cvl']
-            if all(col in df.columns for col in predictors):
-                X_input = df[predictors]
-                y_pred = model.predict(X_input)
-                y_pred = scaler_target.inverse_transform(y_pred.reshape(-1,1)).ravel()
-                df["CO2"] = y_pred
-
-                # --- Display final table ---
-                st.markdown("---")
-                st.subheader("🌱 Predicted CO2")
-                st.dataframe(df[["date","latitude","longitude","CO2"]], use_container_width=True)
-    except Exception as e:
-        st.error(f"⚠️ Could not fetch data or predict: {e}")
+    if st.button("➕ Add to prediction batch"):
+        st.session_state["pending_queries"].append(
+            {"date": selected_date, "latitude": lat, "longitude": lon}
+        )
 else:
     st.info("👉 Please select both a date and a location")
 
+queries = st.session_state["pending_queries"]
+if queries:
+    st.markdown("---")
+    st.subheader("🗂️ Pending queries")
+    st.dataframe(pd.DataFrame(queries), use_container_width=True)
+
+    if st.button("🔮 Predict All") and model and scaler_target:
+        save_dir = "era5_data"
+        os.makedirs(save_dir, exist_ok=True)
+        try:
+            # --- Fetch values, one batched read per distinct date ---
+            # Try the queue-less Zarr mirror first; fall back to CDS
+            # (threaded batch download + local extraction) if it fails.
+            dates = sorted({q["date"] for q in queries})
+            per_date_values = {}
+            cds_dates = []
+            for d in dates:
+                group = [q for q in queries if q["date"] == d]
+                lats = tuple(q["latitude"] for q in group)
+                lons = tuple(q["longitude"] for q in group)
+                try:
+                    per_date_values[d] = fetch_era5_zarr(d.isoformat(), lats, lons, tuple(ERA5_VARS))
+                except Exception:
+                    cds_dates.append(d)
+
+            if cds_dates:
+                download_era5_batch(cds_dates, save_dir, ERA5_VARS, "era5")
+                for d in cds_dates:
+                    group = [q for q in queries if q["date"] == d]
+                    nc_path = download_era5(d.year, d.month, d.day, save_dir, ERA5_VARS, "era5")
+                    lats = tuple(q["latitude"] for q in group)
+                    lons = tuple(q["longitude"] for q in group)
+                    per_date_values[d] = extract_nearest_values_batch(nc_path, lats, lons)
+
+            # --- Assemble the feature matrix directly in NumPy ---
+            # A one-dict-per-row DataFrame costs pandas construction,
+            # dtype inference and a column re-select; filling a
+            # preallocated float32 matrix in predictor order skips all
+            # of it. pandas only enters for the display table.
+            X_input = np.empty((len(queries), len(PREDICTORS)), dtype=np.float32)
+            display_rows = []
+            row = 0
+            for d in dates:
+                group = [q for q in queries if q["date"] == d]
+                batch_values = per_date_values[d]
+                for i, q in enumerate(group):
+                    values_map = {"latitude": q["latitude"], "longitude": q["longitude"],
+                                  "year": d.year, "month": d.month, "day": d.day}
+                    for nc_var, arr in batch_values.items():
+                        values_map[nc_var] = np.nan if arr is None else float(arr[i])
+                    X_input[row] = [values_map[k] for k in PREDICTORS]
+                    display_rows.append({"date": d, "latitude": q["latitude"], "longitude": q["longitude"]})
+                    row += 1
+
+            # --- Predict CO2 for the whole batch at once ---
+            y_pred = predict_co2(X_input)
+            y_pred = scaler_target.inverse_transform(y_pred.reshape(-1,1)).ravel()
+
+            # --- Display final table ---
+            df = pd.DataFrame(display_rows)
+            df["CO2"] = y_pred
+            st.markdown("---")
+            st.subheader("🌱 Predicted CO2")
+            st.dataframe(df[["date","latitude","longitude","CO2"]], use_container_width=True)
+            st.session_state["pending_queries"] = []
+        except Exception as e:
+            st.error(f"⚠️ Could not fetch data or predict: {e}")
+
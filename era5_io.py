@@ -0,0 +1,252 @@
+import os
+import streamlit as st
+import numpy as np
+import xarray as xr
+import cfgrib
+import h5py
+import cdsapi
+from sklearn.neighbors import BallTree
+from numba import njit
+from concurrent.futures import ThreadPoolExecutor
+
+# Shared ERA5 download/extraction layer for the Streamlit pages.
+# Everything cache-decorated here is cached once per process, so both
+# app.py and oco2.py reuse the same CDS client, file handles and trees.
+
+# ---------------------------
+# Variable mappings
+# ---------------------------
+VAR_MAP = {
+    "10m_u_component_of_wind": "u10",
+    "10m_v_component_of_wind": "v10",
+    "2m_temperature": "t2m",
+    "surface_pressure": "sp",
+    "high_vegetation_cover": "cvh",
+    "low_vegetation_cover": "cvl",
+    "leaf_area_index_high_vegetation": "lai_hv",
+    "leaf_area_index_low_vegetation": "lai_lv",
+}
+
+ERA5_VARS = list(VAR_MAP.keys())
+
+# ---------------------------
+# CDS API client (Streamlit Cloud credentials)
+# ---------------------------
+@st.cache_resource(show_spinner=False)
+def init_cds_client():
+    # Runs once per process: the stat/open/write dance for ~/.cdsapirc
+    # and the client construction don't belong in every rerun
+    cds_path = os.path.expanduser("~/.cdsapirc")
+    if not os.path.exists(cds_path):
+        try:
+            with open(cds_path, "w") as f:
+                f.write(
+                    f"url: https://cds.climate.copernicus.eu/api\n"
+                    f"key: {st.secrets['CDSAPI_UID']}:{st.secrets['CDSAPI_KEY']}\n"
+                )
+        except KeyError:
+            st.error("⚠️ CDS API credentials not set in Streamlit secrets!")
+    return cdsapi.Client()
+
+# ---------------------------
+# ERA5 download functions
+# ---------------------------
+def build_era5_request(year, month, day, variables):
+    return {
+        "product_type": ["reanalysis"],
+        "variable": variables,
+        "year": str(year),
+        "month": f"{month:02d}",
+        "day": f"{day:02d}",
+        "time": ["13:00"],
+        # GRIB skips the expensive server-side NetCDF conversion (and its
+        # size cap); we decode locally with cfgrib instead
+        "format": "grib"
+    }
+
+def rechunk_for_point_access(grib_path, nc_path):
+    # CDS delivers fields laid out for whole-map reads, but we only ever
+    # pull single (lat, lon) points. Re-writing with tiny spatial chunks
+    # means a point read touches one small chunk instead of the full field.
+    #
+    # The combined GRIB mixes levels (t2m at heightAboveGround=2, winds
+    # at 10), which a single open_dataset cannot represent — it would
+    # silently drop the winds. open_datasets (plural) decodes one dataset
+    # per level; dropping the conflicting scalar coords lets them merge.
+    datasets = [
+        ds.drop_vars([c for c in ds.coords if c not in ds.dims], errors="ignore")
+        for ds in cfgrib.open_datasets(grib_path,
+                                       backend_kwargs={"indexpath": ""})
+    ]
+    ds = xr.merge(datasets)
+    missing = [v for v in VAR_MAP.values() if v not in ds]
+    if missing:
+        raise RuntimeError(f"GRIB decode dropped variables: {missing}")
+    encoding = {}
+    for var in ds.data_vars:
+        chunks = tuple(4 if dim in ("latitude", "longitude") else 1
+                       for dim in ds[var].dims)
+        encoding[var] = {"zlib": True, "complevel": 1, "chunksizes": chunks}
+    ds.to_netcdf(nc_path + ".tmp", engine="netcdf4", encoding=encoding)
+    os.replace(nc_path + ".tmp", nc_path)
+
+@st.cache_data(ttl=86400, persist="disk", show_spinner=False)
+def download_era5(year, month, day, save_path, variables, prefix):
+    # One combined request: CDS queues each request separately, so asking
+    # for all variables at once avoids waiting in the queue twice.
+    grib_filename = f"{prefix}_{year}-{month:02d}-{day:02d}.grib"
+    grib_path = os.path.join(save_path, grib_filename)
+    nc_path = os.path.splitext(grib_path)[0] + ".nc"
+    if not os.path.exists(grib_path):
+        init_cds_client().retrieve(
+            "reanalysis-era5-single-levels",
+            build_era5_request(year, month, day, variables)
+        ).download(grib_path)
+    if not os.path.exists(nc_path):
+        rechunk_for_point_access(grib_path, nc_path)
+    return nc_path
+
+def download_era5_batch(dates, save_path, variables, prefix, max_workers=6):
+    # CDS serves ~5-6 requests per user in parallel, so for multi-date
+    # fetches we submit them all at once and let them queue server-side.
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(
+            lambda d: download_era5(d.year, d.month, d.day, save_path, variables, prefix),
+            dates
+        ))
+
+# ---------------------------
+# ARCO-ERA5 Zarr fast path
+# ---------------------------
+# Google's analysis-ready ERA5 mirror on GCS: no CDS queue, and Zarr
+# chunked HTTP range reads pull only the bytes around the query point.
+ARCO_ERA5_ZARR = "gs://gcp-public-data-arco-era5/ar/full_37-1h-0p25deg-chunk-1.zarr-v3"
+
+@st.cache_resource(show_spinner=False)
+def open_arco_era5():
+    return xr.open_zarr(ARCO_ERA5_ZARR, chunks=None,
+                        storage_options={"token": "anon"})
+
+@st.cache_data(ttl=86400, show_spinner=False)
+def fetch_era5_zarr(date_iso, lats, lons, variables):
+    ds = open_arco_era5()
+    sel = ds[list(variables)].sel(time=f"{date_iso}T13:00")
+    # ARCO-ERA5 longitudes run 0..360, the map hands us -180..180
+    lats = np.atleast_1d(np.asarray(lats, dtype=float))
+    lons = np.atleast_1d(np.asarray(lons, dtype=float)) % 360.0
+    points = sel.sel(
+        latitude=xr.DataArray(lats, dims="points"),
+        longitude=xr.DataArray(lons, dims="points"),
+        method="nearest",
+    )
+    return {VAR_MAP.get(v, v): np.asarray(points[v].values, dtype=float)
+            for v in variables}
+
+# ---------------------------
+# Extract nearest values
+# ---------------------------
+@st.cache_resource(show_spinner=False)
+def open_era5_file(nc_path):
+    # Daily single-level files are small (tens of MB), so the HDF5 core
+    # driver slurps the whole file into memory on first open; every
+    # later read is served from that image with no syscalls. The handle
+    # is cached per path and deliberately never closed.
+    return h5py.File(nc_path, "r", driver="core", backing_store=False,
+                     rdcc_nbytes=67108864, rdcc_nslots=10007)
+
+@st.cache_resource(show_spinner=False)
+def load_grid_coords(nc_path):
+    # Coordinate arrays never change for a given file, so read them once
+    # and reuse across reruns instead of re-reading them on every click
+    f = open_era5_file(nc_path)
+    return f["longitude"][:], f["latitude"][:]
+
+@njit(cache=True, fastmath=True)
+def nearest_idx(values, target, period=0.0):
+    # Single pass: no temporary |values - target| array, no Python
+    # dispatch. period=360 makes longitude wrap at the antimeridian;
+    # the raw difference can exceed a full period (map lons are
+    # -180..180, grid lons 0..359.75), so reduce mod period before
+    # folding to the shorter way around.
+    best_i = 0
+    best_d = 1e30
+    for i in range(values.shape[0]):
+        d = abs(values[i] - target)
+        if period > 0.0:
+            d = d % period
+            if period - d < d:
+                d = period - d
+        if d < best_d:
+            best_d = d
+            best_i = i
+    return best_i
+
+@st.cache_resource(show_spinner=False)
+def build_grid_tree(nc_path):
+    # BallTree on the haversine metric finds the truly nearest grid node
+    # on the sphere (per-axis argmin gets wraparound wrong near the
+    # antimeridian); built once per file and cached
+    lon_values, lat_values = load_grid_coords(nc_path)
+    lon_grid, lat_grid = np.meshgrid(lon_values, lat_values)
+    coords_rad = np.deg2rad(np.column_stack([lat_grid.ravel(), lon_grid.ravel()]))
+    return BallTree(coords_rad, metric="haversine")
+
+def nearest_grid_indices(nc_path, lats, lons):
+    tree = build_grid_tree(nc_path)
+    lon_values, _ = load_grid_coords(nc_path)
+    query_rad = np.deg2rad(np.column_stack([lats, lons]))
+    flat_idx = tree.query(query_rad, k=1)[1].ravel()
+    n_lon = lon_values.shape[0]
+    return flat_idx // n_lon, flat_idx % n_lon
+
+@st.cache_resource(show_spinner=False)
+def list_file_vars(nc_path):
+    # Which of our 8 variables a file actually holds never changes, so
+    # the per-variable "is it in the file" metadata walk is done once
+    f = open_era5_file(nc_path)
+    return tuple(v for v in VAR_MAP.values() if v in f)
+
+@st.cache_data(show_spinner=False)
+def extract_nearest_values_batch(nc_path, lats, lons):
+    # Vectorized variant for many (lat, lon) query points: all nearest
+    # indices come from one BallTree query, then each field is read
+    # once and fancy-indexed, instead of N per-point roundtrips.
+    lats = np.atleast_1d(np.asarray(lats, dtype=float))
+    lons = np.atleast_1d(np.asarray(lons, dtype=float))
+    if len(lats) == 1:
+        # A lone point doesn't justify building the 1M-node BallTree;
+        # the JIT'd scalar path answers from the cached coord arrays
+        point = extract_nearest_values(nc_path, float(lats[0]), float(lons[0]))
+        return {nc_var: None if v is None else np.array([v])
+                for nc_var, v in point.items()}
+    lat_idx, lon_idx = nearest_grid_indices(nc_path, lats, lons)
+    values = {nc_var: None for nc_var in VAR_MAP.values()}
+    f = open_era5_file(nc_path)
+    for nc_var in list_file_vars(nc_path):
+        field = np.asarray(f[nc_var])
+        values[nc_var] = field[..., lat_idx, lon_idx].reshape(-1, len(lats))[0]
+    return values
+
+@st.cache_data(show_spinner=False)
+def extract_nearest_values(nc_path, lat, lon):
+    # The file is NetCDF4, i.e. HDF5 underneath; h5py reads it directly
+    # without the extra netCDF layer. The 64 MB chunk cache keeps the
+    # small spatial chunks resident across the per-variable reads.
+    # Single-point lookups skip the BallTree query overhead: the JIT'd
+    # scan over ~1440 floats per axis is effectively free. All variables
+    # at the point come back from one file open.
+    values = {nc_var: None for nc_var in VAR_MAP.values()}
+    lon_values, lat_values = load_grid_coords(nc_path)
+    lat_idx = nearest_idx(np.ascontiguousarray(lat_values, dtype=np.float64), lat)
+    lon_idx = nearest_idx(np.ascontiguousarray(lon_values, dtype=np.float64), lon, 360.0)
+    f = open_era5_file(nc_path)
+    for nc_var in list_file_vars(nc_path):
+        # Explicit 1x1 hyperslab: HDF5 reads exactly one chunk
+        # instead of materializing any larger selection
+        dset = f[nc_var]
+        index = (0,) * (dset.ndim - 2) + (
+            slice(lat_idx, lat_idx + 1),
+            slice(lon_idx, lon_idx + 1),
+        )
+        values[nc_var] = float(dset[index].ravel()[0])
+    return values
@@ -0,0 +1,33 @@
+"""One-time export of the trained RandomForest pipeline to ONNX.
+
+Run locally after (re)training:  python export_onnx.py
+Commit the resulting rf_pipeline.onnx next to rf_pipeline.pkl; the app
+prefers the ONNX session (compiled tree traversal) when it is present.
+Needs skl2onnx installed (dev-time only, not a runtime dependency).
+
+Note: onnxruntime's quantize_dynamic does not apply here — the exported
+graph is a single ai.onnx.ml TreeEnsembleRegressor, which dynamic
+quantization rejects outright (and it only rewrites MatMul/Gemm weights
+anyway, never tree thresholds).
+"""
+
+import joblib
+from skl2onnx import convert_sklearn
+from skl2onnx.common.data_types import FloatTensorType
+
+PKL_PATH = "rf_pipeline.pkl"
+ONNX_PATH = "rf_pipeline.onnx"
+N_FEATURES = 13  # latitude..cvl, see PREDICTORS in app.py
+
+bundle = joblib.load(PKL_PATH)
+model = bundle["model"]
+
+onnx_model = convert_sklearn(
+    model,
+    initial_types=[("X", FloatTensorType([None, N_FEATURES]))],
+)
+
+with open(ONNX_PATH, "wb") as f:
+    f.write(onnx_model.SerializeToString())
+
+print(f"Exported {PKL_PATH} -> {ONNX_PATH}")
@@ -1,14 +1,17 @@
 import streamlit as st
-import cdsapi
 import zipfile
 import os
-import pandas as pd
+import io
+import csv
+import requests
+
+from era5_io import init_cds_client, build_era5_request
 
 # --- Streamlit Page Setup ---
 st.set_page_config(page_title="ERA5 Downloader", layout="centered")
 
 st.title("📥 ERA5 Data Downloader")
-st.markdown("Select a date to download ERA5 single-level + ERA5 vegetation data (NetCDF inside a ZIP). A CSV log will be updated.")
+st.markdown("Select a date to download ERA5 single-level + ERA5 vegetation data (GRIB inside a ZIP). A CSV log will be updated.")
 
 # --- Date Input ---
 selected_date = st.date_input("Select Date")
@@ -23,9 +26,11 @@ if st.button("Download ERA5 Data"):
         day = f"{selected_date.day:02d}"
         date_str = f"{year}-{month}-{day}"
 
-        client = cdsapi.Client()
+        client = init_cds_client()
 
-        # --- Dataset 1: ERA5 Single Levels (atmosphere hourly) ---
+        # --- ERA5 Single Levels (atmosphere + vegetation, one request) ---
+        # Both variable sets live on the same CDS endpoint, so a single
+        # combined request only goes through the CDS queue once.
         single_level_vars = [
             "10m_u_component_of_wind",
             "10m_v_component_of_wind",
@@ -34,20 +39,6 @@ if st.button("Download ERA5 Data"):
             "total_precipitation"
         ]
 
-        request_single = {
-            "product_type": "reanalysis",
-            "variable": single_level_vars,
-            "year": year,
-            "month": month,
-            "day": day,
-            "time": ["13:00"],
-            "format": "netcdf"
-        }
-
-        nc_single = f"era5_single_{year}{month}{day}.nc"
-        client.retrieve("reanalysis-era5-single-levels", request_single).download(nc_single)
-
-        # --- Dataset 2: ERA5 Single Levels (vegetation hourly) ---
         vegetation_vars = [
             "high_vegetation_cover",
             "low_vegetation_cover",
@@ -57,53 +48,54 @@ if st.button("Download ERA5 Data"):
             "type_of_low_vegetation"
         ]
 
-        request_veg = {
-            "product_type": "reanalysis",
-            "variable": vegetation_vars,
-            "year": year,
-            "month": month,
-            "day": day,
-            "time": ["13:00"],
-            "format": "netcdf"
-        }
+        request_combined = build_era5_request(
+            selected_date.year, selected_date.month, selected_date.day,
+            single_level_vars + vegetation_vars
+        )
 
-        nc_veg = f"era5_veg_{year}{month}{day}.nc"
-        client.retrieve("reanalysis-era5-single-levels", request_veg).download(nc_veg)
+        result = client.retrieve("reanalysis-era5-single-levels", request_combined)
 
-        # --- Combine into ZIP ---
+        # --- Stream straight into an in-memory ZIP ---
+        # The archive only exists to hand to st.download_button, so it
+        # never needs to touch the filesystem: the HTTP response is
+        # written chunk-by-chunk into a BytesIO-backed archive. GRIB is
+        # already compressed, so ZIP_STORED skips pointless re-deflation.
+        grib_combined = f"era5_combined_{year}{month}{day}.grib"
         zip_filename = f"era5_combined_{year}{month}{day}.zip"
-        with zipfile.ZipFile(zip_filename, "w", zipfile.ZIP_DEFLATED) as zipf:
-            zipf.write(nc_single)
-            zipf.write(nc_veg)
-
-        # ✅ CSV logging
+        zip_buf = io.BytesIO()
+        with zipfile.ZipFile(zip_buf, "w", zipfile.ZIP_STORED) as zipf:
+            with zipf.open(grib_combined, "w", force_zip64=True) as zf:
+                with requests.get(result.location, stream=True) as r:
+                    r.raise_for_status()
+                    for chunk in r.iter_content(chunk_size=1 << 20):
+                        zf.write(chunk)
+
+        # ✅ CSV logging (append one line instead of re-parsing the
+        # whole log with pandas on every download)
         csv_file = "download_log.csv"
-        new_entry = pd.DataFrame([{
-            "date": date_str,
-            "variables": ", ".join(single_level_vars + vegetation_vars),
-            "netcdf_files": f"{nc_single}, {nc_veg}",
-            "zip_file": zip_filename
-        }])
-
-        if os.path.exists(csv_file):
-            df = pd.read_csv(csv_file)
-            df = pd.concat([df, new_entry], ignore_index=True)
-        else:
-            df = new_entry
-
-        df.to_csv(csv_file, index=False)
+        header = ["date", "variables", "netcdf_files", "zip_file"]
+        need_header = not os.path.exists(csv_file)
+        with open(csv_file, "a", newline="") as f:
+            writer = csv.writer(f)
+            if need_header:
+                writer.writerow(header)
+            writer.writerow([
+                date_str,
+                ", ".join(single_level_vars + vegetation_vars),
+                grib_combined,
+                zip_filename
+            ])
 
         # Success message
         st.success(f"Downloaded and zipped: {zip_filename}")
 
         # Download button for the ZIP file
-        with open(zip_filename, "rb") as f:
-            st.download_button(
-                "⬇️ Download ZIP File",
-                f,
-                file_name=zip_filename,
-                mime="application/zip"
-            )
+        st.download_button(
+            "⬇️ Download ZIP File",
+            zip_buf.getvalue(),
+            file_name=zip_filename,
+            mime="application/zip"
+        )
 
         # Download button for the CSV log
         with open(csv_file, "rb") as f:
@@ -113,8 +105,3 @@ if st.button("Download ERA5 Data"):
                 file_name=csv_file,
                 mime="text/csv"
             )
-
-        # Cleanup temporary files
-        os.remove(nc_single)
-        os.remove(nc_veg)
-        os.remove(zip_filename)